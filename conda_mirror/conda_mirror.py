@@ -1,22 +1,32 @@
 import argparse
 import bz2
 import fnmatch
+import functools
 import hashlib
+import heapq
 import itertools
 import json
 import logging
-import multiprocessing
+import mmap
 import os
 import pdb
-import random
 import re
 import shutil
 import sys
 import tarfile
 import tempfile
+import threading
 import time
+import zipfile
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Future,
+    ThreadPoolExecutor,
+    as_completed,
+    wait,
+)
 from pprint import pformat
-from typing import Any, Callable, Dict, Optional, Set, Union
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Union
 
 import requests
 import yaml
@@ -27,16 +37,76 @@ try:
 except ImportError:
     from .versionspec import BuildNumberMatch, VersionSpec
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
 logger = None
 
+# Exceptions raised when reading the metadata of a corrupted conda package.
+PACKAGE_READ_ERRORS = (tarfile.TarError, zipfile.BadZipFile, EOFError, KeyError)
+if zstandard is not None:
+    PACKAGE_READ_ERRORS += (zstandard.ZstdError,)
+
 DEFAULT_BAD_LICENSES = ["agpl", ""]
 
 DEFAULT_PLATFORMS = ["linux-64", "linux-32", "osx-64", "win-64", "win-32", "noarch"]
 
-DEFAULT_CHUNK_SIZE = 16 * 1024
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+
+# Minimum number of blacklist/whitelist rules for which the package attributes
+# they match on are lowercased once up front, see `_normalize_packages`.
+NORMALIZE_MIN_RULES = 10
+
+# Size of the pieces repodata.json.bz2 is compressed in, see
+# `_bz2_compress_streams`.
+BZ2_STREAM_SIZE = 4 * 1024 * 1024
+
+# Name of the file caching which packages in a directory passed validation.
+VALIDATION_CACHE_FILENAME = ".conda-mirror-validated.json"
+
+# File name extensions of conda packages.
+CONDA_PACKAGE_EXTENSIONS = (".tar.bz2", ".conda")
+
+# Upper bound (a power of two) on the backoff window between download retries.
+MAX_BACKOFF_WINDOW = 1 << 16
+
+# Number of connections kept alive per host by the HTTP session.
+DEFAULT_POOL_MAXSIZE = 32
+
+# Downloaded packages are validated and moved into the mirror whenever this
+# many bytes or this many packages were downloaded since the last checkpoint.
+CHECKPOINT_BYTES = 512 * 1024 * 1024
+CHECKPOINT_COUNT = 64
+
+# Size of the buffer used to stream package files through hash functions.
+HASH_CHUNK_SIZE = 1024 * 1024
 
 # Pattern matching special characters in version/build string matchers.
 VERSION_SPEC_CHARS = re.compile(r"[<>=^$!]")
+VERSION_SPEC_CHARSET = frozenset("<>=^$!")
+
+# Pattern matching a dotted version number, e.g. "1.2.3".
+VERSION_NUMBER = re.compile(r"\d+(?:\.\d+)*")
+
+# Translation table deleting comparison operators from version specs.
+VERSION_OPERATORS_TABLE = str.maketrans("", "", "=<>")
+
+# Pattern matching special characters in glob expressions.
+GLOB_CHARS = re.compile(r"[*?[]")
+
+
+def _json_loads(data):
+    """Parse JSON from `data` (str or bytes), using orjson if available."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
 
 
 def _maybe_split_channel(channel):
@@ -84,7 +154,9 @@ def _match(
     all_packages: Dict[str, Dict[str, Any]],
     key_pattern_dict: Dict[str, str],
     python_version: Optional[str] = None,
-    only_most_recent: bool = False
+    only_most_recent: bool = False,
+    normalized: bool = False,
+    platform: Optional[str] = None,
 ):
     """
 
@@ -95,6 +167,12 @@ def _match(
     key_pattern_dict : Dictionary mapping keys to patterns
         The pattern may either be a glob expression or if the key is 'version' may also
         be a conda version specifier.
+    normalized : bool, optional
+        If True, `all_packages` is a view built by `_normalize_packages`, so its
+        values are not lowercased again.
+    platform : str, optional
+        The 'subdir' of packages whose metadata does not contain it, see
+        `get_repodata`.
 
     Returns
     -------
@@ -104,14 +182,12 @@ def _match(
 
     """
     matched = dict()
-    matched_to_python_version = dict()
     matchers: Dict[str, Callable[[Any], bool]] = {}
     
-    for key, pattern in sorted(key_pattern_dict.items()):
-        
+    for key, pattern in key_pattern_dict.items():
         key = key.lower()
         pattern = pattern.lower()
-        if key == "version" and VERSION_SPEC_CHARS.search(pattern):
+        if key == "version" and not VERSION_SPEC_CHARSET.isdisjoint(pattern):
             # If matching the version and the pattern contains one of the characters
             # in '<>=^$!', then use conda's version matcher, otherwise assume a glob.
             if " " in pattern:
@@ -120,54 +196,186 @@ def _match(
                 if "build" not in matchers:
                     matchers["build"] = _build_matcher(build_pattern)
             matcher = _version_matcher(pattern)
-        elif key == "build" and VERSION_SPEC_CHARS.search(pattern):
+        elif key == "build" and not VERSION_SPEC_CHARSET.isdisjoint(pattern):
             matcher = _build_matcher(pattern)
         else:
             matcher = _glob_matcher(pattern)
         matchers[key] = matcher
 
-    for pkg_name, pkg_info in all_packages.items():
-        # normalize the strings so that comparisons are easier
-        if all(
-            matcher(str(pkg_info.get(key, "")).lower())
-            for key, matcher in matchers.items()
-        ):
-            matched.update({pkg_name: pkg_info})
-
     if python_version:
+        # filter on the python version in the same pass as the other keys
         python_version_pattern = f"^.*py{re.sub(VERSION_SPEC_CHARS,'',python_version).replace('.','')}.*$"
         python_version_matcher = _build_matcher(python_version_pattern)
-        for pkg_name, pkg_info in matched.items():
-            if python_version_matcher(str(pkg_info.get("build","")).lower()): 
-                matched_to_python_version.update({pkg_name: pkg_info})
-        matched = matched_to_python_version
-        
+        if "build" in matchers:
+            matchers["build"] = _chain_matchers(
+                matchers["build"], python_version_matcher
+            )
+        else:
+            matchers["build"] = python_version_matcher
+
+    # check the name first, since that usually rules out the most packages
+    package_matchers = [
+        _key_matcher(key, matcher, normalized, platform)
+        for key, matcher in sorted(matchers.items(), key=lambda kv: kv[0] != "name")
+    ]
+    for pkg_name, pkg_info in all_packages.items():
+        if all(matcher(pkg_info) for matcher in package_matchers):
+            matched[pkg_name] = pkg_info
+
     only_most_recent_versions = dict()
     if only_most_recent:
-        for pkg_name, pkg_info in dict(sorted(matched.items(), reverse=True)).items():
-            pkg_info=all_packages[pkg_name]
-            if pkg_name.split("-")[0] not in [name.split("-")[0] for name, info in only_most_recent_versions.items()] and pkg_name.split("-")[-1] not in [name.split("-")[-1] for name, info in only_most_recent_versions.items()]:
-                only_most_recent_versions.update({pkg_name: pkg_info})
+        seen_first: Set[str] = set()
+        seen_last: Set[str] = set()
+        for pkg_name in sorted(matched, reverse=True):
+            first = pkg_name.partition("-")[0]
+            last = pkg_name.rpartition("-")[2]
+            if first not in seen_first and last not in seen_last:
+                only_most_recent_versions[pkg_name] = all_packages[pkg_name]
+                seen_first.add(first)
+                seen_last.add(last)
         matched = only_most_recent_versions
             
     return matched
 
 
-def _glob_matcher(pattern: str) -> Callable[[Any], bool]:
-    """Returns a function that will match against given glob expression."""
+def _match_any(
+    all_packages: Dict[str, Dict[str, Any]],
+    key_pattern_dicts: Iterable[Dict[str, str]],
+    normalized: bool = False,
+    platform: Optional[str] = None,
+) -> Set[str]:
+    """Returns the names of the packages that match any of `key_pattern_dicts`.
+
+    Rules consisting of a single glob pattern are grouped by key and each group
+    is compiled into a single regex, so that all of them are checked in one
+    pass over `all_packages` instead of one pass per rule. Any other rule is
+    handed to `_match`.
+
+    Parameters
+    ----------
+    all_packages : Dictionary mapping package file names to metadata dictionary for that instance.
+        Represents package metadata dicts from repodata.json
+    key_pattern_dicts : Iterable of dictionaries mapping keys to patterns, see `_match`
+    normalized, platform : optional
+        See `_match`
+
+    Returns
+    -------
+    matched : set
+        Names of the packages in `all_packages` matching any of the rules
+    """
+    matched: Set[str] = set()
+    globs_by_key: Dict[str, List[str]] = {}
+    for key_pattern_dict in key_pattern_dicts:
+        if len(key_pattern_dict) == 1:
+            ((key, pattern),) = key_pattern_dict.items()
+            key = key.lower()
+            pattern = pattern.lower()
+            if key not in ("version", "build") or VERSION_SPEC_CHARSET.isdisjoint(
+                pattern
+            ):
+                globs_by_key.setdefault(key, []).append(pattern)
+                continue
+        matched.update(
+            _match(
+                all_packages,
+                key_pattern_dict,
+                normalized=normalized,
+                platform=platform,
+            )
+        )
+
+    for key, patterns in globs_by_key.items():
+        regex = re.compile("|".join(fnmatch.translate(p) for p in patterns))
+        matcher = _key_matcher(key, regex.match, normalized, platform)
+        matched.update(
+            pkg_name for pkg_name, pkg_info in all_packages.items() if matcher(pkg_info)
+        )
+    return matched
+
+
+def _key_matcher(
+    key: str,
+    matcher: Callable[[Any], bool],
+    normalized: bool = False,
+    platform: Optional[str] = None,
+) -> Callable[[Dict[str, Any]], bool]:
+    """Returns a function that applies `matcher` to the `key` attribute of a
+    package metadata dict. If `normalized`, the attribute is expected to be
+    lowercased already, see `_normalize_packages`. A missing 'subdir' defaults
+    to `platform`."""
+    if normalized:
+
+        def _match_key(pkg_info):
+            return matcher(pkg_info.get(key, ""))
 
-    def _globmatch(v, p=pattern):
-        return fnmatch.fnmatch(v, p)
+    else:
+        default = _attribute_default(key, platform)
+
+        def _match_key(pkg_info):
+            # normalize the strings so that comparisons are easier
+            return matcher(str(pkg_info.get(key, default)).lower())
+
+    return _match_key
+
+
+def _attribute_default(key: str, platform: Optional[str] = None) -> str:
+    """Returns the value used for the `key` attribute of packages whose
+    metadata does not contain it. Apparently some channels on anaconda.org do
+    not contain the 'subdir' field, it is the platform of the repodata then."""
+    if key == "subdir" and platform:
+        return platform
+    return ""
+
+
+def _normalize_packages(
+    all_packages: Dict[str, Dict[str, Any]],
+    keys: Iterable[str],
+    platform: Optional[str] = None,
+) -> Dict[str, Dict[str, str]]:
+    """Returns a view of `all_packages` holding only the `keys` attributes of
+    each package, as lowercased strings. A missing 'subdir' defaults to
+    `platform`.
+
+    Matching several rules against the view with `normalized=True` lowercases
+    each attribute once instead of once per rule.
+    """
+    defaults = {key: _attribute_default(key, platform) for key in keys}
+    return {
+        pkg_name: {
+            key: str(pkg_info.get(key, default)).lower()
+            for key, default in defaults.items()
+        }
+        for pkg_name, pkg_info in all_packages.items()
+    }
+
+
+def _chain_matchers(*matchers: Callable[[Any], bool]) -> Callable[[Any], bool]:
+    """Returns a function that matches only if all of the given matchers do."""
+
+    def _chained(v):
+        return all(matcher(v) for matcher in matchers)
 
-    return _globmatch
+    return _chained
 
 
+@functools.lru_cache(maxsize=None)
+def _glob_matcher(pattern: str) -> Callable[[Any], bool]:
+    """Returns a function that will match against given glob expression."""
+    if not GLOB_CHARS.search(pattern):
+        # literal pattern, no need to go through a regex
+        return pattern.__eq__
+    return re.compile(fnmatch.translate(pattern)).match
+
+
+@functools.lru_cache(maxsize=None)
 def _version_matcher(pattern: str) -> Callable[[Any], bool]:
     """Returns a function that will match against given conda version specifier."""
     # Throw away build string pattern if present.
     return VersionSpec(pattern.split(" ")[0]).match
 
 
+@functools.lru_cache(maxsize=None)
 def _build_matcher(pattern: str) -> Callable[[Any], bool]:
     """Returns a function that will match against a build string"""
     return BuildNumberMatch(pattern).match
@@ -186,6 +394,12 @@ class DependsMatcher:
         else:
             self._build_matcher = lambda _: True
 
+    @classmethod
+    @functools.lru_cache(maxsize=None)
+    def from_spec(cls, pattern: str) -> "DependsMatcher":
+        """Returns a shared matcher instance for `pattern`."""
+        return cls(pattern)
+
     def __call__(self, pkg_info: Dict[str, Any]) -> bool:
         return self._version_matcher(
             pkg_info.get("version", "")
@@ -196,7 +410,7 @@ def _restore_required_dependencies(
     all_packages: Dict[str, Dict[str, Any]],
     excluded: Set[str],
     required: Set[str],
-    only_most_recent: bool
+    only_most_recent: bool = False,
 ) -> Set[str]:
     """Recursively removes dependencies of required packages from excluded packages.
 
@@ -219,6 +433,9 @@ def _restore_required_dependencies(
     New set of excluded packages with dependencies removed.
     """
 
+    # the logger is not set up when used as a library
+    log = logger or logging.getLogger("conda_mirror")
+
     cur_required = set(required)
 
     # TODO - support platform-specific + noarch
@@ -227,8 +444,14 @@ def _restore_required_dependencies(
 
     final_excluded: Set[str] = set(excluded)
 
+    # index excluded packages by package name
+    excluded_by_name: Dict[str, Set[str]] = {}
+    for k in final_excluded:
+        pkg_name = all_packages.get(k, {}).get("name")
+        excluded_by_name.setdefault(pkg_name, set()).add(k)
+
     while len(final_excluded) > 0 and len(cur_required) > 0:
-        print("STAGE",cur_required)
+        log.debug("Restoring dependencies of %s", cur_required)
         required_depend_specs: Dict[str, Set[str]] = {}
 
         # collate version specs of dependencies package by package name
@@ -237,48 +460,45 @@ def _restore_required_dependencies(
         for req in cur_required:
             # get the full info for that package-name
             info = all_packages.get(req, {})
-            print("all depends for", req)
-            print(info.get("depends"))
+            log.debug("%s depends on %s", req, info.get("depends"))
             # for each dependency for the currently marked-as-required package
             for dep in info.get("depends", ()):
                 # something here to filter info.get to specific python version(s) and most up-to-date dependencies
                 try:
                     pkg_name, version_spec = dep.split(maxsplit=1)
                     if only_most_recent:
-                        print(version_spec)
+                        original_spec = version_spec
                         version_spec = version_spec.split(",")
-                        print(version_spec)
                         version_spec = version_spec[1] if len(version_spec) > 1 else version_spec[0]
-                        print(version_spec)
-                        version_spec = version_spec.replace("=","").replace("<","").replace(">","")
-                        print(version_spec)
-                        version_spec = re.search(r"(\d+(\.\d+)*)", version_spec).group()
-                        print(version_spec)
-                        version_spec = version_spec
-                        print(version_spec)
+                        version_number = VERSION_NUMBER.search(
+                            version_spec.translate(VERSION_OPERATORS_TABLE)
+                        )
+                        version_spec = version_number.group() if version_number else ""
+                        log.debug(
+                            "Narrowed %s %s to %s", pkg_name, original_spec, version_spec
+                        )
                         # TODO 31032025 still haivng issues getting the version_spec to be directly matched to a version of a given package,
                         # even though the version_spec number comes directly from the registry of available packages..
                 except ValueError:
                     pkg_name, version_spec = dep, ""
-                print("already_required",already_required)
-                print(pkg_name, "already in required", pkg_name in already_required)
                 if pkg_name not in already_required:
-                    print("adding",pkg_name,version_spec)
+                    log.debug("Adding dependency %s %s", pkg_name, version_spec)
                     required_depend_specs.setdefault(pkg_name, set()).add(version_spec)
 
         cur_required.clear()
 
-        for k in list(final_excluded):
-            info = all_packages.get(k, {})
-            pkg_name = info.get("name")
-            for version_spec in required_depend_specs.get(pkg_name, ()):
-                print("matching for",pkg_name, version_spec)
-                matcher = DependsMatcher(version_spec)
-                if matcher(info):
-                    print("matched",k)
+        # only look at the excluded packages with a name that is depended upon
+        for pkg_name, version_specs in required_depend_specs.items():
+            candidates = excluded_by_name.get(pkg_name)
+            if not candidates:
+                continue
+            matchers = [DependsMatcher.from_spec(spec) for spec in version_specs]
+            for k in list(candidates):
+                info = all_packages.get(k, {})
+                if any(matcher(info) for matcher in matchers):
+                    candidates.remove(k)
                     final_excluded.remove(k)
                     cur_required.add(k)
-                    break
 
     return final_excluded
 
@@ -395,6 +615,15 @@ def _make_arg_parser():
         help="Skip validation of files already present in target-directory",
         default=False,
     )
+    ap.add_argument(
+        "--full-validate",
+        action="store_true",
+        help=(
+            "Rehash all files present in target-directory, including the ones "
+            "that are unchanged since they last passed validation"
+        ),
+        default=False,
+    )
     ap.add_argument(
         "--minimum-free-space",
         help=("Threshold for free diskspace. Given in megabytes."),
@@ -459,6 +688,23 @@ def _make_arg_parser():
         dest="max_packages",
         help="Limit the total number of packages downloaded",
     )
+    ap.add_argument(
+        "--download-threads",
+        action="store",
+        default=1,
+        type=int,
+        dest="download_threads",
+        help="Num of packages to download concurrently. 1: Serial mode.",
+    )
+    ap.add_argument(
+        "--parallel-bz2",
+        action="store_true",
+        help=(
+            "Compress repodata.json.bz2 on all cores. The result is a "
+            "multi-stream bz2 file, which some bz2 decoders only read partially"
+        ),
+        default=False,
+    )
     return ap
 
 
@@ -579,6 +825,9 @@ def _parse_and_format_args():
         "con_timeout": args.con_timeout,
         "show_progress": args.show_progress,
         "max_packages": args.max_packages,
+        "download_threads": args.download_threads,
+        "full_validate": args.full_validate,
+        "parallel_bz2": args.parallel_bz2,
     }
 
 
@@ -607,16 +856,122 @@ def _remove_package(pkg_path, reason):
     if logger:
         logger.warning(msg)
     else:
-        # Logging breaks in multiprocessing in Windows
-        # TODO: Fix this properly with a logging Queue
+        # the logger is not set up, e.g. when used as a library
         sys.stdout.write("Warning: " + msg)
     os.remove(pkg_path)
     return pkg_path, msg
 
 
-def _validate(filename, md5=None, size=None):
+def _hash_file(filename, algorithm, chunk_size=HASH_CHUNK_SIZE):
+    """Compute the hex digest of the file at `filename` without reading it
+    into memory all at once.
+
+    The file is memory mapped and hashed in a single call if possible, so
+    the hash function walks the mapped pages directly. Otherwise it is
+    streamed through a buffer of `chunk_size` bytes.
+
+    Parameters
+    ----------
+    filename : str
+        The path to the file to hash
+    algorithm : str
+        Name of a hash algorithm known to `hashlib`, e.g. "md5"
+    chunk_size : int, optional
+        Size of the buffer the file is streamed through, in bytes
+
+    Returns
+    -------
+    str
+        The hex digest of the file contents
+    """
+    with open(filename, "rb", buffering=0) as f:
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ValueError, OSError):
+            # empty files can not be mapped, nor can files that do not fit
+            # into the address space
+            mm = None
+        if mm is not None:
+            with mm:
+                if hasattr(mmap, "MADV_SEQUENTIAL"):
+                    mm.madvise(mmap.MADV_SEQUENTIAL)
+                return hashlib.new(algorithm, mm).hexdigest()
+
+        h = hashlib.new(algorithm)
+        buf = bytearray(chunk_size)
+        view = memoryview(buf)
+        while True:
+            n = f.readinto(buf)
+            if not n:
+                break
+            h.update(view[:n])
+        return h.hexdigest()
+
+
+def _read_index_json(filename):
+    """Read `info/index.json` from the conda package at `filename` without
+    decompressing more of the package than necessary.
+
+    Parameters
+    ----------
+    filename : str
+        The path to a .tar.bz2 or .conda package
+
+    Returns
+    -------
+    bytes
+        The raw contents of `info/index.json`. For .conda packages this is
+        only read if `zstandard` is installed, otherwise only the checksum of
+        the (small) info archive in the zip file is checked and empty bytes
+        are returned.
+
+    Raises
+    ------
+    KeyError
+        If the package does not contain the metadata
+    """
+    if filename.endswith(".conda"):
+        with zipfile.ZipFile(filename) as z:
+            # .conda packages are zip files with a tiny info-*.tar.zst member
+            # next to the (large) pkg-*.tar.zst member
+            base = os.path.basename(filename)[: -len(".conda")]
+            info_tar = z.read(f"info-{base}.tar.zst")
+        if zstandard is None:
+            if logger:
+                logger.debug(
+                    "zstandard is not installed, skipping the integrity check "
+                    "of the metadata of %s",
+                    filename,
+                )
+            return b""
+        reader = zstandard.ZstdDecompressor().stream_reader(info_tar)
+        t = tarfile.open(fileobj=reader, mode="r|")
+    else:
+        t = tarfile.open(filename)
+
+    with t:
+        # stop at the metadata member instead of indexing the whole archive
+        for member in t:
+            if member.name == "info/index.json":
+                return t.extractfile(member).read()
+    raise KeyError("info/index.json not found in %s" % filename)
+
+
+def _expected_digest(md5=None, sha256=None):
+    """Returns the name of the preferred hash algorithm and the expected digest
+    given the `md5` and `sha256` of a package, or (None, None) if neither is
+    known. sha256 is preferred since it is hardware accelerated on most modern
+    CPUs."""
+    if sha256:
+        return "sha256", sha256
+    if md5:
+        return "md5", md5
+    return None, None
+
+
+def _validate(filename, md5=None, size=None, sha256=None):
     """Validate the conda package tarfile located at `filename` with any of the
-    passed in options `md5` or `size. Also implicitly validate that
+    passed in options `sha256`, `md5` or `size`. Also implicitly validate that
     the conda package is a valid tarfile.
 
     NOTE: Removes packages that fail validation
@@ -626,10 +981,15 @@ def _validate(filename, md5=None, size=None):
     filename : str
         The path to the file you wish to validate
     md5 : str, optional
-        If provided, perform an `md5sum` on `filename` and compare to `md5`
+        If provided, perform an `md5sum` on `filename` and compare to `md5`.
+        Ignored if `sha256` is also provided.
     size : int, optional
         if provided, stat the file at `filename` and make sure its size
-        matches `size`
+        matches `size`. This is checked before hashing the file.
+    sha256 : str, optional
+        If provided, perform a `sha256sum` on `filename` and compare to
+        `sha256`. Preferred over `md5` since sha256 is hardware accelerated
+        on most modern CPUs.
 
     Returns
     -------
@@ -638,25 +998,26 @@ def _validate(filename, md5=None, size=None):
     reason : str
         The reason why the package is being removed
     """
-    if md5:
-        calc = hashlib.md5(open(filename, "rb").read()).hexdigest()
-        if calc == md5:
-            # If the MD5 matches, skip the other checks
+    # a single stat catches truncated or oversized files without reading them
+    if size and size != os.stat(filename).st_size:
+        return _remove_package(filename, reason="Failed size test")
+
+    algorithm, expected = _expected_digest(md5=md5, sha256=sha256)
+    if expected:
+        calc = _hash_file(filename, algorithm)
+        if calc == expected:
+            # If the hash matches, skip the other checks
             return filename, None
         else:
             return _remove_package(
                 filename,
-                reason="Failed md5 validation. Expected: %s. Computed: %s"
-                % (calc, md5),
+                reason="Failed %s validation. Expected: %s. Computed: %s"
+                % (algorithm, expected, calc),
             )
 
-    if size and size != os.stat(filename).st_size:
-        return _remove_package(filename, reason="Failed size test")
-
     try:
-        with tarfile.open(filename) as t:
-            t.extractfile("info/index.json").read().decode("utf-8")
-    except (tarfile.TarError, EOFError):
+        _read_index_json(filename).decode("utf-8")
+    except PACKAGE_READ_ERRORS:
         logger.info(
             "Validation failed because conda package is corrupted.", exc_info=True
         )
@@ -665,7 +1026,29 @@ def _validate(filename, md5=None, size=None):
     return filename, None
 
 
-def get_repodata(channel, platform, proxies=None, ssl_verify=None):
+def _make_session(pool_maxsize=DEFAULT_POOL_MAXSIZE):
+    """Create a `requests.Session` that keeps connections to the upstream
+    channel alive so they are reused across requests.
+
+    Parameters
+    ----------
+    pool_maxsize : int, optional
+        Maximum number of connections to keep open per host
+
+    Returns
+    -------
+    session : requests.Session
+    """
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(
+        pool_connections=pool_maxsize, pool_maxsize=pool_maxsize
+    )
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def get_repodata(channel, platform, proxies=None, ssl_verify=None, session=None):
     """Get the repodata.json file for a channel/platform combo on anaconda.org
 
     Parameters
@@ -678,35 +1061,36 @@ def get_repodata(channel, platform, proxies=None, ssl_verify=None):
         Proxys for connecting internet
     ssl_verify : str or bool
         Path to a CA_BUNDLE file or directory with certificates of trusted CAs
+    session : requests.Session, optional
+        HTTP session instance. A new one is created if not given.
 
     Returns
     -------
     info : dict
     packages : dict
-        keyed on package name (e.g., twisted-16.0.0-py35_0.tar.bz2)
+        keyed on package name (e.g., twisted-16.0.0-py35_0.tar.bz2). Some
+        channels omit the 'subdir' of their packages, it is `platform` then,
+        i.e. use ``pkg_info.get("subdir") or platform``.
     """
     url_template, channel = _maybe_split_channel(channel)
     url = url_template.format(
         channel=channel, platform=platform, file_name="repodata.json"
     )
 
-    resp = requests.get(url, proxies=proxies, verify=ssl_verify)
+    if session is None:
+        session = _make_session()
+    resp = session.get(url, proxies=proxies, verify=ssl_verify)
     try:
         resp.raise_for_status()
     except requests.exceptions.HTTPError:
         raise RuntimeError(
             f"platform {platform} for channel {channel} not found on anaconda.org"
         )
-    resp = resp.json()
+    # parse the raw bytes, skipping the decode to str done by resp.json()
+    resp = _json_loads(resp.content)
     info = resp.get("info", {})
     packages = resp.get("packages", {})
     packages.update(resp.get("packages.conda", {}))
-    # Patch the repodata.json so that all package info dicts contain a "subdir"
-    # key.  Apparently some channels on anaconda.org do not contain the
-    # 'subdir' field. I think this this might be relegated to the
-    # Continuum-provided channels only, actually.
-    for pkg_name, pkg_info in packages.items():
-        pkg_info.setdefault("subdir", platform)
     return info, packages
 
 
@@ -720,6 +1104,8 @@ def _download(
     chunk_size: int = DEFAULT_CHUNK_SIZE,
     show_progress=False,
     con_timeout=360,
+    hash_algorithm=None,
+    cancel_event: Optional[threading.Event] = None,
 ):
     """Download `url` to `target_directory`
 
@@ -737,11 +1123,20 @@ def _download(
         Path to a CA_BUNDLE file or directory with certificates of trusted CAs
     show_progress: bool
         Whether to display progress bars.
+    hash_algorithm: str, optional
+        Name of a hash algorithm known to `hashlib`. If given, the downloaded
+        bytes are hashed while they are written to disk.
+    cancel_event: threading.Event, optional
+        If given, the download is aborted with a RuntimeError once the event
+        is set.
 
     Returns
     -------
     file_size: int
         The size in bytes of the file that was downloaded
+    digest: str
+        The hex digest of the file that was downloaded, or None if
+        `hash_algorithm` is not given
     """
     file_size = 0
     logger.info("download_url=%s", url)
@@ -762,12 +1157,17 @@ def _download(
             unit="byte",
             unit_scale=True,
         )
+        h = hashlib.new(hash_algorithm) if hash_algorithm else None
         for data in ret.iter_content(chunk_size):
+            if cancel_event is not None and cancel_event.is_set():
+                raise RuntimeError(f"Download of {url} was cancelled")
             tf.write(data)
+            if h is not None:
+                h.update(data)
+            file_size += len(data)
             progress.update(len(data))
         progress.close()
-        file_size = os.path.getsize(download_filename)
-    return file_size
+    return file_size, (h.hexdigest() if h is not None else None)
 
 
 def _download_backoff_retry(
@@ -781,6 +1181,8 @@ def _download_backoff_retry(
     max_retries: int = 100,
     show_progress=True,
     con_timeout=360,
+    hash_algorithm=None,
+    cancel_event: Optional[threading.Event] = None,
 ):
     """Download `url` to `target_directory` with exponential backoff in the
     event of failure.
@@ -804,18 +1206,28 @@ def _download_backoff_retry(
         default 100.
     show_progress: bool
         Whether to display progress bars.
+    hash_algorithm: str, optional
+        Name of a hash algorithm known to `hashlib`. If given, the downloaded
+        bytes are hashed while they are written to disk.
+    cancel_event: threading.Event, optional
+        If given, the download is aborted without retrying once the event is
+        set.
 
     Returns
     -------
     file_size: int
         The size in bytes of the file that was downloaded
+    digest: str
+        The hex digest of the file that was downloaded, or None if
+        `hash_algorithm` is not given
     """
     c = 0
     two_c = 1
     delay = 5.12e-5  # 51.2 us
     while c < max_retries:
         c += 1
-        two_c *= 2
+        # stop doubling the backoff window at ~3.4 s
+        two_c = min(two_c * 2, MAX_BACKOFF_WINDOW)
         try:
             rtn = _download(
                 url,
@@ -826,12 +1238,18 @@ def _download_backoff_retry(
                 chunk_size=chunk_size,
                 show_progress=show_progress,
                 con_timeout=con_timeout,
+                hash_algorithm=hash_algorithm,
+                cancel_event=cancel_event,
             )
             break
         except Exception:
-            if c < max_retries:
+            cancelled = cancel_event is not None and cancel_event.is_set()
+            if c < max_retries and not cancelled:
                 logger.debug(f"downloading failed, retrying {c}/{max_retries}")
-                time.sleep(delay * random.randint(0, two_c - 1))
+                # two_c is a power of two, so masking gives a uniform jitter;
+                # os.urandom is safe to call from concurrent download threads
+                jitter = int.from_bytes(os.urandom(4), "little") & (two_c - 1)
+                time.sleep(delay * jitter)
             else:
                 raise
     return rtn
@@ -850,23 +1268,28 @@ def _list_conda_packages(local_dir):
     list
         List of conda packages in `local_dir`
     """
-    results = []
-    if os.path.isdir(local_dir):
-        contents = os.listdir(local_dir)
-        results = [
-            fn for fn in contents if fn.endswith(".tar.bz2") or fn.endswith(".conda")
-        ]
-    return results
-
-
-def _validate_packages(package_repodata, package_directory, num_threads=1):
+    try:
+        with os.scandir(local_dir) as entries:
+            return [
+                entry.name
+                for entry in entries
+                if entry.name.endswith(CONDA_PACKAGE_EXTENSIONS)
+            ]
+    except (FileNotFoundError, NotADirectoryError):
+        return []
+
+
+def _validate_packages(
+    package_repodata, package_directory, num_threads=1, use_cache=False, verified=()
+):
     """Validate local conda packages.
 
     NOTE1: This will remove any packages that are in `package_directory` that
            are not in `repodata` and also any packages that fail the package
            validation
-    NOTE2: In concurrent mode (num_threads is not 1) this might be hard to kill
-           using CTRL-C.
+    NOTE2: In concurrent mode (num_threads is not 1) CTRL-C only takes effect
+           once the packages that are being hashed are done, the remaining
+           ones are not validated.
 
     Parameters
     ----------
@@ -875,29 +1298,61 @@ def _validate_packages(package_repodata, package_directory, num_threads=1):
     package_directory : str
         Path to the local repo that contains conda packages
     num_threads : int
-        Number of concurrent processes to use. Set to `0` to use a number of
-        processes equal to the number of cores in the system. Defaults to `1`
+        Number of concurrent threads to use. Set to `0` to use a number of
+        threads equal to the number of cores in the system. Defaults to `1`
         (i.e. serial package validation).
+    use_cache : bool, optional
+        If True, skip packages whose size, modification time and expected
+        digest are unchanged since they last passed validation, and record
+        the packages that pass validation in a cache file in
+        `package_directory`. Defaults to False.
+    verified : container of str, optional
+        Names of packages whose digest has already been checked against the
+        repodata, e.g. while they were downloaded. These are not hashed again.
 
     Returns
     -------
-    list
+    iterable
         Iterable of twoples of (pkg_path, reason) where
         pkg_path : str
             The full path to the package that is being removed
         reason : str
             The reason why the package is being removed
+        The validation is done while the iterable is consumed.
     """
     # validate local conda packages
     local_packages = _list_conda_packages(package_directory)
+    cache = _load_validation_cache(package_directory) if use_cache else None
 
-    # create argument list (necessary because multiprocessing.Pool.map does not
+    # create argument list (necessary because Executor.map does not
     # accept additional args to be passed to the mapped function)
     num_packages = len(local_packages)
-    val_func_arg_list = [
-        (package, num, num_packages, package_repodata, package_directory)
-        for num, package in enumerate(sorted(local_packages))
-    ]
+    val_func_arg_list = []
+    cached_packages = []
+    verified_results = []
+    # join the directory once instead of once per package
+    prefix = os.path.join(package_directory, "")
+    for num, package in enumerate(sorted(local_packages)):
+        package_path = prefix + package
+        package_metadata = package_repodata.get(package)
+        if package in verified and package_metadata is not None:
+            verified_results.append((package_path, None))
+            continue
+        if (
+            cache is not None
+            and package_metadata is not None
+            and cache.get(package)
+            == _validation_cache_entry(package_path, package_metadata)
+        ):
+            cached_packages.append((package, package_path))
+            continue
+        val_func_arg_list.append(
+            (package, num, num_packages, package_metadata, package_path)
+        )
+    if cached_packages:
+        logger.info(
+            "Skipping validation of %s unchanged packages", len(cached_packages)
+        )
 
     if num_threads == 1 or num_threads is None:
         # Do serial package validation (Takes a long time for large repos)
@@ -912,12 +1367,88 @@ def _validate_packages(package_repodata, package_directory, num_threads=1):
         logger.info(
             "Will use {} threads for package validation." "".format(num_threads)
         )
-        p = multiprocessing.Pool(num_threads)
-        validation_results = p.map(_validate_or_remove_package, val_func_arg_list)
-        p.close()
-        p.join()
+        validation_results = _validate_concurrently(val_func_arg_list, num_threads)
+
+    if verified_results:
+        validation_results = itertools.chain(verified_results, validation_results)
+    if cache is None:
+        return validation_results
+    return _update_validation_cache(
+        package_repodata, package_directory, cache, cached_packages, validation_results
+    )
+
+
+def _validation_cache_entry(package_path, package_metadata):
+    """Returns the validation cache entry of a package, which is a list of the
+    size, the modification time and the expected digest of the package."""
+    st = os.stat(package_path)
+    digest = package_metadata.get("sha256") or package_metadata.get("md5")
+    return [st.st_size, st.st_mtime_ns, digest]
+
+
+def _load_validation_cache(package_directory):
+    """Load the validation cache of `package_directory`, see
+    `_validation_cache_entry`. Returns an empty cache if there is none."""
+    cache_path = os.path.join(package_directory, VALIDATION_CACHE_FILENAME)
+    try:
+        with open(cache_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _update_validation_cache(
+    package_repodata, package_directory, cache, cached_packages, validation_results
+):
+    """Yield the results of the cached and the actual validations, then write
+    the entries of all packages that passed to the cache file."""
+    new_cache = {}
+    for package, pkg_path in cached_packages:
+        new_cache[package] = cache[package]
+        yield pkg_path, None
+
+    for pkg_path, reason in validation_results:
+        package = os.path.basename(pkg_path)
+        if reason is None:
+            new_cache[package] = _validation_cache_entry(
+                pkg_path, package_repodata[package]
+            )
+        yield pkg_path, reason
+
+    _write_validation_cache(package_directory, new_cache)
+
+
+def _write_validation_cache(package_directory, cache):
+    """Atomically replace the validation cache of `package_directory` with
+    `cache`."""
+    cache_path = os.path.join(package_directory, VALIDATION_CACHE_FILENAME)
+    with open(cache_path + ".tmp", "w") as f:
+        json.dump(cache, f)
+    os.replace(cache_path + ".tmp", cache_path)
+
 
-    return validation_results
+def _validate_concurrently(val_func_arg_list, num_threads):
+    """Run `_validate_or_remove_package` over `val_func_arg_list` on a pool
+    of `num_threads` threads, yielding results in order of completion.
+
+    hashlib releases the GIL while hashing, so threads give real parallelism
+    without having to pickle the task arguments. Yielding the results as they
+    complete means a single slow package does not hold back the others.
+    """
+    with ThreadPoolExecutor(max_workers=num_threads) as executor:
+        futures = [
+            executor.submit(_validate_or_remove_package, args)
+            for args in val_func_arg_list
+        ]
+        try:
+            for future in as_completed(futures):
+                yield future.result()
+        except BaseException:
+            # e.g. CTRL-C or the results are not consumed anymore, do not
+            # start validating the remaining packages
+            for future in futures:
+                future.cancel()
+            raise
 
 
 def _validate_or_remove_package(args):
@@ -929,8 +1460,9 @@ def _validate_or_remove_package(args):
         - `args[0]` is `package`.
         - `args[1]` is the number of the package in the list of all packages.
         - `args[2]` is the number of all packages.
-        - `args[3]` is `package_repodata`.
-        - `args[4]` is `package_directory`.
+        - `args[3]` is the repodata entry of `package`, or None if the
+          package is not in the repodata.
+        - `args[4]` is the full path to `package`.
 
     Returns
     -------
@@ -943,23 +1475,19 @@ def _validate_or_remove_package(args):
     package = args[0]
     num = args[1]
     num_packages = args[2]
-    package_repodata = args[3]
-    package_directory = args[4]
+    package_metadata = args[3]
+    package_path = args[4]
 
     # ensure the packages in this directory are in the upstream
     # repodata.json
-    try:
-        package_metadata = package_repodata[package]
-    except KeyError:
+    if package_metadata is None:
         log_msg = f"{package} is not in the upstream index. Removing..."
         if logger:
             logger.warning(log_msg)
         else:
-            # Windows does not handle multiprocessing logging well
-            # TODO: Fix this properly with a logging Queue
+            # the logger is not set up, e.g. when used as a library
             sys.stdout.write("Warning: " + log_msg)
         reason = "Package is not in the repodata index"
-        package_path = os.path.join(package_directory, package)
         return _remove_package(package_path, reason=reason)
     # validate the integrity of the package, the size of the package and
     # its hashes
@@ -967,15 +1495,28 @@ def _validate_or_remove_package(args):
     if logger:
         logger.info(log_msg)
     else:
-        # Windows does not handle multiprocessing logging well
-        # TODO: Fix this properly with a logging Queue
+        # the logger is not set up, e.g. when used as a library
         sys.stdout.write("Info: " + log_msg)
-    package_path = os.path.join(package_directory, package)
     return _validate(
-        package_path, md5=package_metadata.get("md5"), size=package_metadata.get("size")
+        package_path,
+        md5=package_metadata.get("md5"),
+        size=package_metadata.get("size"),
+        sha256=package_metadata.get("sha256"),
     )
 
 
+def _completed_future(fn, *args, **kwargs):
+    """Call `fn` in the current thread and return a future that is already
+    done with its result or exception, for use in place of
+    `Executor.submit`."""
+    future = Future()
+    try:
+        future.set_result(fn(*args, **kwargs))
+    except Exception as ex:
+        future.set_exception(ex)
+    return future
+
+
 def main(
     upstream_channel,
     target_directory,
@@ -997,6 +1538,9 @@ def main(
     con_timeout=360,
     show_progress: bool = True,
     max_packages=None,
+    download_threads=1,
+    full_validate=False,
+    parallel_bz2=False,
 ):
     """
 
@@ -1065,6 +1609,17 @@ def main(
     max_packages : int, optional
         Maximum number of packages to mirror. If not set, will mirror all packages
         in list
+    download_threads : int, optional
+        Number of packages to download concurrently. Defaults to `1`
+        (i.e. serial downloads).
+    full_validate : bool, optional
+        Defaults to False.
+        If True, rehash all files already present in target_directory, even
+        the ones that are unchanged since they last passed validation.
+    parallel_bz2 : bool, optional
+        Defaults to False.
+        If True, compress repodata.json.bz2 on all cores into a multi-stream
+        bz2 file, which some bz2 decoders do not read completely.
 
     Returns
     -------
@@ -1128,8 +1683,16 @@ def main(
     if not dry_run:
         os.makedirs(local_directory, exist_ok=True)
 
+    download_threads = max(download_threads or 1, 1)
+    # keep a connection alive for each download thread, otherwise the
+    # surplus connections would be discarded and renegotiated per package
+    session = _make_session(pool_maxsize=max(DEFAULT_POOL_MAXSIZE, download_threads))
     info, packages = get_repodata(
-        upstream_channel, platform, proxies=proxies, ssl_verify=ssl_verify
+        upstream_channel,
+        platform,
+        proxies=proxies,
+        ssl_verify=ssl_verify,
+        session=session,
     )
 
     # 1. validate local repo
@@ -1141,13 +1704,36 @@ def main(
     # 2. figure out excluded packages
     excluded_packages: Set[str] = set()
     required_packages: Set[str] = set()
+    # with many rules, lowercase the attributes the rules look at once for
+    # all of them. Building that view costs about as much as a few passes
+    # over the packages, so with few rules they are matched directly
+    rules = list(itertools.chain(blacklist or (), whitelist or ()))
+    for wlist in python_whitelist or ():
+        for whitelist_values in dict(wlist).values():
+            rules.extend(whitelist_values)
+    match_packages = packages
+    normalized = len(rules) >= NORMALIZE_MIN_RULES
+    if normalized:
+        rule_keys = set()
+        for rule in rules:
+            for key, pattern in rule.items():
+                key = key.lower()
+                rule_keys.add(key)
+                if key == "version" and " " in pattern:
+                    # the version spec also matches the build string
+                    rule_keys.add("build")
+        if python_whitelist:
+            # the python version is matched against the build string
+            rule_keys.add("build")
+        match_packages = _normalize_packages(packages, rule_keys, platform)
     # match blacklist conditions
     if blacklist:
-        for blist in blacklist:
-            logger.debug("exclude item: %s", blist)
-            matched_packages = list(_match(packages, blist))
-            logger.debug(pformat(matched_packages))
-            excluded_packages.update(matched_packages)
+        logger.debug("exclude items: %s", blacklist)
+        excluded_packages.update(
+            _match_any(
+                match_packages, blacklist, normalized=normalized, platform=platform
+            )
+        )
 
     # 3. un-blacklist packages that are actually whitelisted
     # match whitelist on blacklist
@@ -1158,10 +1744,12 @@ def main(
             for python_version, whitelist_values in wlist.items():
                 for val in whitelist_values:
                     matched_packages = list(_match(
-                        packages,
+                        match_packages,
                         val,
                         python_version,
-                        only_most_recent
+                        only_most_recent,
+                        normalized=normalized,
+                        platform=platform,
                     ))
                     required_packages.update(matched_packages)
                 excluded_packages.difference_update(required_packages)
@@ -1169,7 +1757,14 @@ def main(
         logger.debug("standard config")
         for wlist in whitelist:
             wlist = dict(wlist)
-            matched_packages = list(_match(packages, wlist, python_version, only_most_recent))
+            matched_packages = list(_match(
+                match_packages,
+                wlist,
+                python_version,
+                only_most_recent,
+                normalized=normalized,
+                platform=platform,
+            ))
             required_packages.update(matched_packages)
         excluded_packages.difference_update(required_packages)
             
@@ -1186,9 +1781,10 @@ def main(
     logger.debug("EXCLUDED PACKAGES")  # this can be very long, so log at debug level
     logger.debug(pformat(sorted(excluded_packages)))
 
-    # Get a list of all packages in the local mirror
+    # Get a list of all packages in the local mirror. This is kept up to date
+    # below instead of rescanning the directory.
+    local_packages = set(_list_conda_packages(local_directory))
     if dry_run:
-        local_packages = _list_conda_packages(local_directory)
         packages_slated_for_removal = [
             pkg_name
             for pkg_name in local_packages
@@ -1200,26 +1796,39 @@ def main(
     possible_packages_to_mirror = set(packages.keys()) - excluded_packages
 
     # 4. Validate all local packages
-    # construct the desired package repodata
-    desired_repodata = {
-        pkgname: packages[pkgname] for pkgname in possible_packages_to_mirror
-    }
     if not (dry_run or no_validate_target):
+        # construct the desired package repodata. Packages that are not local
+        # are never looked up, so only the entries of the local ones are
+        # handed to the validation workers
+        desired_repodata = {
+            pkgname: packages[pkgname]
+            for pkgname in local_packages
+            if pkgname in possible_packages_to_mirror
+        }
         # Only validate if we're not doing a dry-run
         validation_results = _validate_packages(
-            desired_repodata, local_directory, num_threads
+            desired_repodata,
+            local_directory,
+            num_threads,
+            use_cache=not full_validate,
         )
-        summary["validating-existing"].update(validation_results)
+        for pkg_path, reason in validation_results:
+            summary["validating-existing"].add((pkg_path, reason))
+            if reason is not None:
+                # the package was removed
+                local_packages.discard(os.path.basename(pkg_path))
     # 5. figure out final list of packages to mirror
     # do the set difference of what is local and what is in the final
     # mirror list
-    local_packages = _list_conda_packages(local_directory)
-    to_mirror = possible_packages_to_mirror - set(local_packages)
+    to_mirror = possible_packages_to_mirror - local_packages
     if max_packages is not None:
-        to_mirror = set(itertools.islice(to_mirror, max_packages))
+        # only the first packages are needed, no need to sort all of them
+        to_download = heapq.nsmallest(max_packages, to_mirror)
+    else:
+        to_download = sorted(to_mirror)
     logger.info("PACKAGES TO MIRROR")
-    logger.info(pformat(sorted(to_mirror)))
-    summary["to-mirror"].update(to_mirror)
+    logger.info(pformat(to_download))
+    summary["to-mirror"].update(to_download)
     if dry_run:
         logger.info("Dry run complete. Exiting")
         return summary
@@ -1232,75 +1841,168 @@ def main(
     total_bytes = 0
     minimum_free_space_kb = minimum_free_space * 1024 * 1024
     download_url, channel = _maybe_split_channel(upstream_channel)
-    session = requests.Session()
+    # the repodata entries of the packages in the local mirror, maintained as
+    # packages are moved there instead of filtering the upstream index again
+    current_repodata_packages = {
+        name: _with_subdir(packages[name], platform)
+        for name in local_packages
+        if name in packages
+    }
+    bytes_since_checkpoint = 0
+    packages_since_checkpoint = 0
+    # packages whose digest was checked while downloading
+    verified: Set[str] = set()
     with tempfile.TemporaryDirectory(dir=temp_directory) as download_dir:
         logger.info("downloading to the tempdir %s", download_dir)
-        for package_counter, package_name in enumerate(
-            tqdm(
-                sorted(to_mirror),
-                desc=platform,
-                unit="package",
-                leave=False,
-                disable=not show_progress,
-            )
-        ):
-            url = download_url.format(
-                channel=channel, platform=platform, file_name=package_name
-            )
-            try:
-                # make sure we have enough free disk space in the temp folder to meet threshold
-                if shutil.disk_usage(download_dir).free < minimum_free_space_kb:
-                    logger.error(
-                        "Disk space below threshold in %s. Aborting download.",
+        progress = tqdm(
+            total=len(to_download),
+            desc=platform,
+            unit="package",
+            leave=False,
+            disable=not show_progress,
+        )
+        remaining = iter(to_download)
+        # maps the downloads in flight to their package name, url and
+        # expected digest
+        in_flight = {}
+        aborted = False
+        checkpoint_due = False
+        # serial downloads run in the main thread, so that CTRL-C stops them
+        # right away
+        executor = (
+            ThreadPoolExecutor(max_workers=download_threads)
+            if download_threads > 1
+            else None
+        )
+        # tells the download threads to stop, e.g. on CTRL-C
+        cancel_event = threading.Event()
+        download = functools.partial(
+            _download_backoff_retry,
+            target_directory=download_dir,
+            session=session,
+            proxies=proxies,
+            ssl_verify=ssl_verify,
+            chunk_size=chunk_size,
+            max_retries=max_retries,
+            # per file progress bars would garble each other
+            show_progress=show_progress and executor is None,
+            con_timeout=con_timeout,
+            cancel_event=cancel_event,
+        )
+        try:
+            while True:
+                # keep download_threads packages downloading concurrently,
+                # sharing the connections of the session. No new downloads are
+                # started once aborted or while waiting for a checkpoint
+                while (
+                    not (aborted or checkpoint_due)
+                    and len(in_flight) < download_threads
+                ):
+                    package_name = next(remaining, None)
+                    if package_name is None:
+                        break
+                    # make sure we have enough free disk space in the temp folder to meet threshold
+                    if shutil.disk_usage(download_dir).free < minimum_free_space_kb:
+                        logger.error(
+                            "Disk space below threshold in %s. Aborting download.",
+                            download_dir,
+                        )
+                        aborted = True
+                        break
+                    url = download_url.format(
+                        channel=channel, platform=platform, file_name=package_name
+                    )
+                    # hash the package while it is being written, so that
+                    # validation does not have to read it again
+                    algorithm, expected = _expected_digest(
+                        md5=packages[package_name].get("md5"),
+                        sha256=packages[package_name].get("sha256"),
+                    )
+                    if executor is None:
+                        future = _completed_future(
+                            download, url, hash_algorithm=algorithm
+                        )
+                    else:
+                        future = executor.submit(
+                            download, url, hash_algorithm=algorithm
+                        )
+                    in_flight[future] = (package_name, url, expected)
+
+                if not in_flight:
+                    if not checkpoint_due or aborted:
+                        break
+                    # Every CHECKPOINT_BYTES or CHECKPOINT_COUNT packages,
+                    # pause to validate and move packages
+                    # If we dont do this then whenever an invocation is interrupted, nothing is saved.
+                    # This serves as basically a checkpoint
+                    # No download is in flight, so no package is partially written
+                    _validate_and_move(
+                        packages,
                         download_dir,
+                        num_threads,
+                        summary,
+                        info,
+                        current_repodata_packages,
+                        local_directory,
+                        platform,
+                        verified,
+                        parallel_bz2=parallel_bz2,
                     )
-                    break
-
-                # download package
-                total_bytes += _download_backoff_retry(
-                    url,
-                    download_dir,
-                    session,
-                    proxies=proxies,
-                    ssl_verify=ssl_verify,
-                    chunk_size=chunk_size,
-                    max_retries=max_retries,
-                    show_progress=show_progress,
-                    con_timeout=con_timeout,
-                )
+                    bytes_since_checkpoint = 0
+                    packages_since_checkpoint = 0
+                    checkpoint_due = False
+                    continue
+
+                # refill the window as soon as any download finishes, so a
+                # large package does not hold back the others
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    package_name, url, expected = in_flight.pop(future)
+                    try:
+                        file_size, digest = future.result()
+                    except Exception as ex:
+                        logger.exception("Unexpected error: %s. Aborting download.", ex)
+                        aborted = True
+                        continue
+                    total_bytes += file_size
+                    bytes_since_checkpoint += file_size
+                    packages_since_checkpoint += 1
+                    if expected and digest == expected:
+                        verified.add(package_name)
+                    summary["downloaded"].add((url, download_dir))
+                    progress.update()
 
                 # make sure we have enough free disk space in the target folder to meet threshold
                 # while also being able to fit the packages we have already downloaded
                 if (
-                    shutil.disk_usage(local_directory).free - total_bytes
-                ) < minimum_free_space_kb:
+                    not aborted
+                    and shutil.disk_usage(local_directory).free - total_bytes
+                    < minimum_free_space_kb
+                ):
                     logger.error(
                         "Disk space below threshold in %s. Aborting download",
                         local_directory,
                     )
-                    break
+                    aborted = True
 
-                summary["downloaded"].add((url, download_dir))
-            except Exception as ex:
-                logger.exception("Unexpected error: %s. Aborting download.", ex)
-                break
-
-            if (package_counter + 1) % 15 == 0:
-                # Every 100 packages, pause to validate and move packages
-                # If we dont do this then whenever an invocation is interrupted, nothing is saved.
-                # This serves as basically a checkpoint
-                _validate_and_move(
-                    packages,
-                    download_dir,
-                    num_threads,
-                    summary,
-                    info,
-                    local_packages,
-                    local_directory,
-                )
-                # After moving packages to their ultimate resting place,
-                # update the packages we have locally
-                local_packages = _list_conda_packages(local_directory)
+                if (
+                    bytes_since_checkpoint >= CHECKPOINT_BYTES
+                    or packages_since_checkpoint >= CHECKPOINT_COUNT
+                ):
+                    # let the downloads in flight finish before the checkpoint
+                    checkpoint_due = True
+        except BaseException:
+            # stop the running downloads after their current chunk instead of
+            # waiting for them, and do not start the queued ones
+            cancel_event.set()
+            for future in in_flight:
+                future.cancel()
+            raise
+        finally:
+            if executor is not None:
+                # all downloads are done unless an exception is raised
+                executor.shutdown(wait=False)
+        progress.close()
 
         # When finished with the loop, validate and move the remaining packages
         _validate_and_move(
@@ -1309,8 +2011,11 @@ def main(
             num_threads,
             summary,
             info,
-            local_packages,
+            current_repodata_packages,
             local_directory,
+            platform,
+            verified,
+            parallel_bz2=parallel_bz2,
         )
 
     # Also need to make a "noarch" channel or conda gets mad
@@ -1323,12 +2028,36 @@ def main(
     return summary
 
 
+def _with_subdir(pkg_info, platform):
+    """Patch a repodata entry so that it contains a "subdir" key, see
+    `_attribute_default`. Only the packages we mirror need patching, not the
+    whole upstream index."""
+    pkg_info.setdefault("subdir", platform)
+    return pkg_info
+
+
 def _validate_and_move(
-    packages, download_dir, num_threads, summary, info, local_packages, local_directory
+    packages,
+    download_dir,
+    num_threads,
+    summary,
+    info,
+    repodata_packages,
+    local_directory,
+    platform,
+    verified=(),
+    parallel_bz2=False,
 ):
-    # validate all packages in the download directory
+    """Validate the packages in `download_dir` and move them to
+    `local_directory` along with an updated repodata.json.
+
+    `repodata_packages` holds the repodata entries of the packages in
+    `local_directory` and is updated in place with the moved packages.
+    """
+    # validate all packages in the download directory, skipping the hashing of
+    # those already verified while downloading
     validation_results = _validate_packages(
-        packages, download_dir, num_threads=num_threads
+        packages, download_dir, num_threads=num_threads, verified=verified
     )
     summary["validating-new"].update(validation_results)
     logger.debug(
@@ -1338,49 +2067,113 @@ def _validate_and_move(
     )
 
     # 8. Use already downloaded repodata.json contents but prune it of
-    # packages we don't want
-    repodata = {"info": info, "packages": packages}
-
-    # compute the packages that we have locally
-    packages_we_have = set(local_packages + _list_conda_packages(download_dir))
-    # remake the packages dictionary with only the packages we have
-    # locally
-    repodata["packages"] = {
-        name: info
-        for name, info in repodata["packages"].items()
-        if name in packages_we_have
-    }
-    _write_repodata(download_dir, repodata)
+    # packages we don't want. The packages that passed validation are added
+    # to the entries of the packages we already have locally; the listing of
+    # the download directory is reused below to move the new packages
+    downloaded_packages = _list_conda_packages(download_dir)
+    for name in downloaded_packages:
+        repodata_packages[name] = _with_subdir(packages[name], platform)
+    repodata = {"info": info, "packages": repodata_packages}
+    _write_repodata(download_dir, repodata, parallel_bz2=parallel_bz2)
+
+    # a plain rename is enough if both directories are on the same device,
+    # shutil.move falls back to copying otherwise
+    if os.stat(download_dir).st_dev == os.stat(local_directory).st_dev:
+        move = os.replace
+    else:
+        move = shutil.move
 
     # move new conda packages
-    for f in _list_conda_packages(download_dir):
-        old_path = os.path.join(download_dir, f)
-        new_path = os.path.join(local_directory, f)
+    download_prefix = os.path.join(download_dir, "")
+    local_prefix = os.path.join(local_directory, "")
+    for f in downloaded_packages:
+        old_path = download_prefix + f
+        new_path = local_prefix + f
         logger.info("moving %s to %s", old_path, new_path)
-        shutil.move(old_path, new_path)
-
+        move(old_path, new_path)
+
+    # the moved packages passed validation, so they do not need to be hashed
+    # again on the next run
+    if downloaded_packages:
+        cache = _load_validation_cache(local_directory)
+        for f in downloaded_packages:
+            cache[f] = _validation_cache_entry(local_prefix + f, packages[f])
+        _write_validation_cache(local_directory, cache)
+
+    # copying to another device writes the destination in place, so the
+    # repodata files are first copied next to the live ones and then
+    # atomically replace them, never leaving a truncated index in the mirror
+    staged = []
     for f in ("repodata.json", "repodata.json.bz2"):
         download_path = os.path.join(download_dir, f)
         move_path = os.path.join(local_directory, f)
-        shutil.move(download_path, move_path)
-
-
-def _write_repodata(package_dir, repodata_dict):
-    data = json.dumps(repodata_dict, indent=2, sort_keys=True)
+        if move is not os.replace:
+            move(download_path, move_path + ".tmp")
+            download_path = move_path + ".tmp"
+        staged.append((download_path, move_path))
+    for download_path, move_path in staged:
+        os.replace(download_path, move_path)
+
+
+def _json_dumps(obj):
+    """Serialize `obj` to indented JSON bytes with sorted keys, no trailing
+    whitespace and a final newline, using orjson if available."""
+    if orjson is not None:
+        # orjson does not emit trailing whitespace
+        return orjson.dumps(
+            obj,
+            option=orjson.OPT_INDENT_2
+            | orjson.OPT_SORT_KEYS
+            | orjson.OPT_APPEND_NEWLINE,
+        )
+    data = json.dumps(obj, indent=2, sort_keys=True)
     # strip trailing whitespace
     data = "\n".join(line.rstrip() for line in data.splitlines())
     # make sure we have newline at the end
     if not data.endswith("\n"):
         data += "\n"
+    return data.encode("utf-8")
 
-    with open(os.path.join(package_dir, "repodata.json"), "w") as fo:
-        fo.write(data)
 
+def _write_repodata(package_dir, repodata_dict, parallel_bz2=False):
+    data = _json_dumps(repodata_dict)
+    json_path = os.path.join(package_dir, "repodata.json")
     # compress repodata.json into the bz2 format. some conda commands still
     # need it
-    bz2_path = os.path.join(package_dir, "repodata.json.bz2")
-    with open(bz2_path, "wb") as fo:
-        fo.write(bz2.compress(data.encode("utf-8")))
+    bz2_path = json_path + ".bz2"
+
+    # write both files completely before moving them into place, so that an
+    # interrupted run never leaves a truncated repodata file behind
+    with open(json_path + ".tmp", "wb") as fo:
+        fo.write(data)
+    with open(bz2_path + ".tmp", "wb") as fo:
+        for stream in _bz2_compress_streams(data, parallel=parallel_bz2):
+            fo.write(stream)
+    os.replace(json_path + ".tmp", json_path)
+    os.replace(bz2_path + ".tmp", bz2_path)
+
+
+def _bz2_compress_streams(data, block_size=BZ2_STREAM_SIZE, parallel=False):
+    """Compress `data` into the bz2 format `block_size` bytes at a time,
+    yielding the compressed bytes in order so they can be written as they are
+    ready.
+
+    By default a single bz2 stream is produced. If `parallel`, the pieces are
+    compressed independently on all available cores (the bz2 module releases
+    the GIL) into a multi-stream bz2 file. Such files are decompressed like a
+    single stream by the bz2 module and the bzip2 tools, but some decoders
+    only read the first stream, so this is opt-in.
+    """
+    view = memoryview(data)
+    blocks = [view[i : i + block_size] for i in range(0, len(data), block_size)]
+    if not parallel or len(blocks) <= 1:
+        compressor = bz2.BZ2Compressor()
+        for block in blocks:
+            yield compressor.compress(block)
+        yield compressor.flush()
+        return
+    with ThreadPoolExecutor() as executor:
+        yield from executor.map(bz2.compress, blocks)
 
 
 if __name__ == "__main__":
@@ -1,12 +1,16 @@
 import bz2
 import copy
+import hashlib
 import itertools
 import json
 import os
 import sys
+import tarfile
+import zipfile
 from os.path import join
 
 import pytest
+import requests
 
 from conda_mirror import conda_mirror
 
@@ -64,6 +68,19 @@ def test_restore_required_dependencies(repodata):
     assert "requests" in reincluded_names
 
 
+def test_restore_required_dependencies_without_logger(monkeypatch):
+    monkeypatch.setattr(conda_mirror, "logger", None)
+    all_packages = {
+        "a-1.0-0.tar.bz2": {"name": "a", "version": "1.0", "depends": ["b >=1"]},
+        "b-1.0-0.tar.bz2": {"name": "b", "version": "1.0", "build": "0"},
+        "c-1.0-0.tar.bz2": {"name": "c", "version": "1.0", "build": "0"},
+    }
+    excluded = conda_mirror._restore_required_dependencies(
+        all_packages, {"b-1.0-0.tar.bz2", "c-1.0-0.tar.bz2"}, {"a-1.0-0.tar.bz2"}
+    )
+    assert excluded == {"c-1.0-0.tar.bz2"}
+
+
 def test_version():
     old_args = copy.copy(sys.argv)
     sys.argv = ["conda-mirror", "--version"]
@@ -226,3 +243,303 @@ def test_dry_run_dumb(tmpdir):
     assert (
         len(ret["to-mirror"]) > 1
     ), "We should have a great deal of packages slated to download"
+
+
+def _write_good_package(target_dir, pkg_name):
+    info_dir = os.path.join(target_dir, "info")
+    os.makedirs(info_dir)
+    with open(os.path.join(info_dir, "index.json"), "w") as f:
+        json.dump({"name": pkg_name}, f)
+    pkg_path = os.path.join(target_dir, pkg_name)
+    with tarfile.open(pkg_path, "w:bz2") as t:
+        t.add(info_dir, arcname="info")
+    return pkg_path
+
+
+def test_validate_prefers_sha256(tmpdir):
+    pkg_path = _write_good_package(tmpdir.strpath, "good-1-0.tar.bz2")
+    with open(pkg_path, "rb") as f:
+        contents = f.read()
+    md5 = hashlib.md5(contents).hexdigest()
+    sha256 = hashlib.sha256(contents).hexdigest()
+
+    assert conda_mirror._validate(pkg_path, md5=md5) == (pkg_path, None)
+    # a matching sha256 wins over a (wrong) md5
+    assert conda_mirror._validate(pkg_path, md5="0" * 32, sha256=sha256) == (
+        pkg_path,
+        None,
+    )
+
+    path, reason = conda_mirror._validate(pkg_path, md5=md5, sha256="0" * 64)
+    assert path == pkg_path
+    assert "sha256" in reason
+    assert not os.path.exists(pkg_path)
+
+
+def test_validate_size_before_hash(tmpdir, monkeypatch):
+    pkg_path = _write_good_package(tmpdir.strpath, "good-1-0.tar.bz2")
+    size = os.path.getsize(pkg_path)
+
+    def _fail(*args, **kwargs):
+        raise AssertionError("package should not be hashed")
+
+    monkeypatch.setattr(conda_mirror, "_hash_file", _fail)
+    path, reason = conda_mirror._validate(pkg_path, size=size + 1, sha256="0" * 64)
+    assert path == pkg_path
+    assert "size" in reason
+    assert not os.path.exists(pkg_path)
+
+
+def test_validate_corrupted_conda_package(tmpdir):
+    pytest.importorskip("zstandard")
+    pkg_path = tmpdir.join("bad-1-0.conda").strpath
+    with zipfile.ZipFile(pkg_path, "w") as z:
+        z.writestr("info-bad-1-0.tar.zst", b"This is not zstd data")
+    path, reason = conda_mirror._validate(pkg_path)
+    assert path == pkg_path
+    assert "Tarfile read failure" in reason
+    assert not os.path.exists(pkg_path)
+
+
+def test_validate_packages_cache(tmpdir, monkeypatch):
+    pkg_name = "good-1-0.tar.bz2"
+    pkg_path = _write_good_package(tmpdir.strpath, pkg_name)
+    with open(pkg_path, "rb") as f:
+        sha256 = hashlib.sha256(f.read()).hexdigest()
+    package_repodata = {pkg_name: {"sha256": sha256}}
+
+    results = list(
+        conda_mirror._validate_packages(
+            package_repodata, tmpdir.strpath, use_cache=True
+        )
+    )
+    assert results == [(pkg_path, None)]
+
+    # unchanged packages are not hashed again
+    def _fail(*args, **kwargs):
+        raise AssertionError("package should not be hashed")
+
+    monkeypatch.setattr(conda_mirror, "_hash_file", _fail)
+    results = list(
+        conda_mirror._validate_packages(
+            package_repodata, tmpdir.strpath, use_cache=True
+        )
+    )
+    assert results == [(pkg_path, None)]
+
+
+def test_validate_packages_verified(tmpdir, monkeypatch):
+    good_name = "good-1-0.tar.bz2"
+    bad_name = "bad-1-0.tar.bz2"
+    good_path = _write_good_package(tmpdir.mkdir("good").strpath, good_name)
+    bad_path = _write_good_package(tmpdir.mkdir("bad").strpath, bad_name)
+    package_dir = tmpdir.mkdir("packages")
+    os.rename(good_path, package_dir.join(good_name).strpath)
+    with open(package_dir.join(good_name).strpath, "rb") as f:
+        good_sha256 = hashlib.sha256(f.read()).hexdigest()
+    package_repodata = {
+        good_name: {"sha256": good_sha256},
+        bad_name: {"sha256": "0" * 64},
+    }
+
+    # packages whose digest matched while downloading are not hashed again
+    def _fail(*args, **kwargs):
+        raise AssertionError("package should not be hashed")
+
+    monkeypatch.setattr(conda_mirror, "_hash_file", _fail)
+    results = list(
+        conda_mirror._validate_packages(
+            package_repodata, package_dir.strpath, verified={good_name}
+        )
+    )
+    assert results == [(package_dir.join(good_name).strpath, None)]
+    monkeypatch.undo()
+
+    # a download whose digest did not match is validated and removed
+    os.rename(bad_path, package_dir.join(bad_name).strpath)
+    results = dict(
+        conda_mirror._validate_packages(
+            package_repodata, package_dir.strpath, verified={good_name}
+        )
+    )
+    assert results[package_dir.join(good_name).strpath] is None
+    assert "sha256" in results[package_dir.join(bad_name).strpath]
+    assert os.listdir(package_dir.strpath) == [good_name]
+
+
+def test_match_any():
+    packages = {
+        "jupyter-1.0-0.tar.bz2": {"name": "jupyter", "version": "1.0", "license": "BSD"},
+        "numpy-1.9-0.tar.bz2": {"name": "numpy", "version": "1.9", "license": "BSD"},
+        "numpy-2.0-0.tar.bz2": {"name": "numpy", "version": "2.0", "license": "BSD"},
+        "agpl-1.0-0.tar.bz2": {"name": "agpl", "version": "1.0", "license": "AGPL"},
+        "nolicense-1.0-0.tar.bz2": {"name": "nolicense", "version": "1.0"},
+    }
+    rules = [
+        {"name": "jupyter"},
+        {"license": "*agpl*"},
+        {"license": ""},
+        {"version": ">=2"},
+    ]
+    expected = set()
+    for rule in rules:
+        expected.update(conda_mirror._match(packages, rule))
+    assert conda_mirror._match_any(packages, rules) == expected
+    assert expected == {
+        "jupyter-1.0-0.tar.bz2",
+        "agpl-1.0-0.tar.bz2",
+        "nolicense-1.0-0.tar.bz2",
+        "numpy-2.0-0.tar.bz2",
+    }
+
+    normalized = conda_mirror._normalize_packages(packages, ["name", "license", "version"])
+    assert conda_mirror._match_any(normalized, rules, normalized=True) == expected
+
+
+def test_match_default_subdir():
+    packages = {
+        "a-1.0-0.tar.bz2": {"name": "a", "version": "1.0"},
+        "b-1.0-0.tar.bz2": {"name": "b", "version": "1.0", "subdir": "noarch"},
+    }
+    rule = {"subdir": "linux-64"}
+    matched = conda_mirror._match(packages, rule, platform="linux-64")
+    assert set(matched) == {"a-1.0-0.tar.bz2"}
+    normalized = conda_mirror._normalize_packages(packages, rule, "linux-64")
+    assert conda_mirror._match_any(normalized, [rule], normalized=True) == set(matched)
+    # the upstream metadata is not patched
+    assert "subdir" not in packages["a-1.0-0.tar.bz2"]
+
+
+def test_bz2_compress_streams():
+    data = json.dumps({"packages": list(range(10000))}).encode()
+
+    # a single stream by default, which any bz2 decoder reads completely
+    compressed = b"".join(conda_mirror._bz2_compress_streams(data, block_size=1000))
+    decompressor = bz2.BZ2Decompressor()
+    assert decompressor.decompress(compressed) == data
+    assert decompressor.eof
+    assert decompressor.unused_data == b""
+
+    streams = list(
+        conda_mirror._bz2_compress_streams(data, block_size=1000, parallel=True)
+    )
+    assert len(streams) > 1
+    assert bz2.decompress(b"".join(streams)) == data
+
+
+def test_write_repodata(tmpdir):
+    repodata = {"info": {}, "packages": {"a-1-0.tar.bz2": {"name": "a"}}}
+    conda_mirror._write_repodata(tmpdir.strpath, repodata)
+    assert sorted(os.listdir(tmpdir.strpath)) == ["repodata.json", "repodata.json.bz2"]
+    with open(tmpdir.join("repodata.json").strpath) as f:
+        assert json.load(f) == repodata
+    with bz2.open(tmpdir.join("repodata.json.bz2").strpath) as f:
+        assert json.load(f) == repodata
+
+
+class _FakeResponse:
+    def __init__(self, content):
+        self.content = content
+        self.headers = {"Content-Length": str(len(content))}
+
+    def iter_content(self, chunk_size):
+        for i in range(0, len(self.content), chunk_size):
+            yield self.content[i : i + chunk_size]
+
+
+class _FakeSession:
+    """Serves the package files in `contents` keyed on their file name."""
+
+    def __init__(self, contents, failing=()):
+        self.contents = contents
+        self.failing = failing
+
+    def get(self, url, **kwargs):
+        file_name = url.rsplit("/", 1)[-1]
+        if file_name in self.failing:
+            raise requests.exceptions.ConnectionError(f"cannot download {url}")
+        return _FakeResponse(self.contents[file_name])
+
+
+def test_main_offline(tmpdir, monkeypatch):
+    platform = "linux-64"
+    contents = {}
+    packages = {}
+    for i in range(7):
+        pkg_name = f"pkg{i}-1.0-0.tar.bz2"
+        pkg_path = _write_good_package(tmpdir.mkdir(f"src{i}").strpath, pkg_name)
+        with open(pkg_path, "rb") as f:
+            contents[pkg_name] = f.read()
+        packages[pkg_name] = {
+            "name": f"pkg{i}",
+            "version": "1.0",
+            "build": "0",
+            "size": len(contents[pkg_name]),
+            "sha256": hashlib.sha256(contents[pkg_name]).hexdigest(),
+        }
+    # the last package to download fails, the others are still mirrored
+    failing = "pkg6-1.0-0.tar.bz2"
+    session = _FakeSession(contents, failing={failing})
+    monkeypatch.setattr(conda_mirror, "_make_session", lambda **kwargs: session)
+    monkeypatch.setattr(
+        conda_mirror, "get_repodata", lambda *args, **kwargs: ({}, packages)
+    )
+    monkeypatch.setattr(conda_mirror, "CHECKPOINT_COUNT", 2)
+    checkpoints = []
+    validate_and_move = conda_mirror._validate_and_move
+
+    def _counting_validate_and_move(*args, **kwargs):
+        checkpoints.append(sorted(conda_mirror._list_conda_packages(args[1])))
+        return validate_and_move(*args, **kwargs)
+
+    monkeypatch.setattr(
+        conda_mirror, "_validate_and_move", _counting_validate_and_move
+    )
+    target_directory = tmpdir.mkdir("target")
+
+    ret = conda_mirror.main(
+        upstream_channel="https://example.com/channel",
+        target_directory=target_directory.strpath,
+        temp_directory=tmpdir.mkdir("temp").strpath,
+        platform=platform,
+        download_threads=3,
+        max_retries=1,
+        show_progress=False,
+    )
+
+    mirrored = sorted(set(packages) - {failing})
+    platform_dir = target_directory.join(platform)
+    assert sorted(conda_mirror._list_conda_packages(platform_dir.strpath)) == mirrored
+    with open(platform_dir.join("repodata.json").strpath) as f:
+        repodata = json.load(f)
+    assert sorted(repodata["packages"]) == mirrored
+    assert {p["subdir"] for p in repodata["packages"].values()} == {platform}
+    assert len(ret["to-mirror"]) == len(packages)
+    assert {url.rsplit("/", 1)[-1] for url, _ in ret["downloaded"]} == set(mirrored)
+    # the partial file of the failed download is removed by the validation
+    validated = {
+        os.path.basename(path): reason for path, reason in ret["validating-new"]
+    }
+    assert sorted(validated) == sorted(packages)
+    assert validated[failing] is not None
+    assert all(validated[pkg_name] is None for pkg_name in mirrored)
+    # a checkpoint moved packages before the end of the run
+    assert len(checkpoints) > 1
+    assert all(checkpoints[:-1])
+
+    # the mirrored packages are not hashed again on the next run
+    def _fail(*args, **kwargs):
+        raise AssertionError("package should not be hashed")
+
+    monkeypatch.setattr(conda_mirror, "_hash_file", _fail)
+    ret = conda_mirror.main(
+        upstream_channel="https://example.com/channel",
+        target_directory=target_directory.strpath,
+        temp_directory=tmpdir.join("temp").strpath,
+        platform=platform,
+        max_retries=1,
+        show_progress=False,
+    )
+    assert sorted(ret["validating-existing"]) == [
+        (platform_dir.join(pkg_name).strpath, None) for pkg_name in mirrored
+    ]